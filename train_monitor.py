@@ -5,12 +5,18 @@ Tracks seat availability and sends Telegram notifications when tickets become av
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+import socket
 import time
-import schedule
 import os
-from datetime import datetime, timedelta
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from typing import Optional
-import json
+from urllib.parse import urlencode
+import orjson
 
 # ============ CONFIGURATION ============
 
@@ -19,6 +25,11 @@ TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
 CHECK_INTERVAL_MINUTES = int(os.environ.get("CHECK_INTERVAL_MINUTES", "5"))
 
+# Optional JSON list of searches to monitor in one process, e.g.
+# [{"search_name": "...", "trips": [{"name": ..., "tripId": ..., ...}]}]
+# Falls back to SEARCH_NAME / TRIPS_TO_MONITOR below when unset.
+CONFIGS_JSON = os.environ.get("CONFIGS_JSON")
+
 # Search name for notifications
 SEARCH_NAME = "Ayutthaya >>> Chiang Mai ::: 07 of JAN, 2026"
 
@@ -53,6 +64,11 @@ TRIPS_TO_MONITOR = [
 BASE_URL = "https://dticket.railway.co.th/DTicketPublicWeb"
 HOME_URL = f"{BASE_URL}/"
 GET_COACH_URL = f"{BASE_URL}/booking/booking/getTrainCoach"
+TELEGRAM_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+
+# Telegram rejects messages over 4096 chars; batch below that with some headroom
+TELEGRAM_MESSAGE_LIMIT = 4000
+NOTIFICATION_SEPARATOR = "\n---\n"
 
 # Headers for AJAX requests
 AJAX_HEADERS = {
@@ -72,21 +88,133 @@ AJAX_HEADERS = {
     "sec-ch-ua-platform": '"macOS"',
 }
 
-# Global state
-session: Optional[requests.Session] = None
-last_session_time: Optional[datetime] = None
-previous_availability = {}
+# (connect, read) timeout for coach requests - fail fast on a dead connection
+COACH_REQUEST_TIMEOUT = (5, 15)
+
+# Cookie that must come back from the home page for a usable session
+SESSION_COOKIE = "JSESSIONID"
+
+# Sessions are refreshed after this long
+SESSION_LIFETIME_SECONDS = 20 * 60
+
+# Only sleeping coaches are tracked
+SEATING_COACH = "Seating Coach"
+
+
+@dataclass(slots=True)
+class Config:
+    """A monitored search: its trips plus the per-search check state."""
+    search_name: str
+    trips: list
+    previous_availability: dict = field(default_factory=dict)
+    previous_hash: dict = field(default_factory=dict)
+    previous_seats: dict = field(default_factory=dict)  # trip -> {coach_no: seats}
+    
+    def __post_init__(self):
+        # Trip POST bodies never change, so encode them once instead of on every request
+        for trip in self.trips:
+            trip["_post_data"] = urlencode({
+                "tripId": trip["tripId"],
+                "provinceStartId": trip["provinceStartId"],
+                "provinceEndId": trip["provinceEndId"],
+                "viewStateHolder": trip["viewStateHolder"],
+            }).encode("ascii")
+
+
+def load_configs() -> list:
+    """Load monitored searches from CONFIGS_JSON, or the built-in search."""
+    if not CONFIGS_JSON:
+        return [Config(SEARCH_NAME, TRIPS_TO_MONITOR)]
+    return [Config(c["search_name"], c["trips"]) for c in orjson.loads(CONFIGS_JSON)]
+
+
+# Telegram message templates
+AVAILABILITY_HEADER_TEMPLATE = "🚂 <b>TICKETS AVAILABLE!</b>\n\n<b>{search}</b>\nTrain: <b>{trip}</b>\n\n"
+AVAILABILITY_ROW_TEMPLATE = "🎫 {coach_type} (Coach #{coach_no})\n   Available: <b>{available_count}</b> seats\n\n"
+STARTUP_TEMPLATE = (
+    "🤖 <b>Train Monitor Started</b>\n\n"
+    "Monitoring {trip_count} trips:\n\n{searches}\n\n"
+    "Check interval: {interval} min\n"
+    "Started: {started}"
+)
+
+# Returned by get_train_coaches when a trip's response body hasn't changed
+UNCHANGED = object()
+
+# Worker threads for the concurrent trip fetches, kept for the life of the
+# process. The railway adapter keeps one pooled connection per worker.
+FETCH_WORKERS = 4
+fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+
+# Dedicated keep-alive session for Telegram so notifications reuse one connection.
+# sendMessage isn't idempotent, so only retry when Telegram has certainly not
+# delivered: failed connects and 429 rate limits. Retry-After is ignored in
+# favour of the backoff (0s, 2s, then 4s) so a long rate limit can't stall
+# the check loop.
+telegram_session = requests.Session()
+telegram_session.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=2,
+    max_retries=Retry(
+        total=3,
+        read=0,
+        backoff_factor=1,
+        status_forcelist=(429,),
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    ),
+))
+
+
+# TCP keepalive probes on pooled connections, so NAT gateways and other
+# middleboxes don't silently drop their mapping during the 5-minute gap
+# between checks. This does not stop the server's own HTTP idle timeout from
+# closing a connection; urllib3 then simply opens a new one.
+SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+if hasattr(socket, "TCP_KEEPIDLE"):  # Not available on macOS
+    SOCKET_OPTIONS += [
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 30),
+    ]
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled sockets use SOCKET_OPTIONS."""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+def create_railway_adapter() -> HTTPAdapter:
+    """Build the pooled adapter used for all railway server requests."""
+    # Retry gateway errors and one failed connect with backoff, but never a read
+    # timeout: the POST may be hung server-side and retrying only multiplies
+    # the stall. 500 is left out on purpose - it means the session cookies
+    # are stale, and get_train_coaches handles it by forcing a refresh.
+    retry = Retry(
+        total=3,
+        connect=1,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+        raise_on_status=False,
+    )
+    return KeepAliveAdapter(pool_connections=4, pool_maxsize=FETCH_WORKERS, max_retries=retry)
 
 
 def log(message: str):
     """Print timestamped log message."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
     print(f"[{timestamp}] {message}", flush=True)
 
 
 def send_telegram_notification(message: str) -> bool:
     """Send a notification via Telegram bot."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {
         "chat_id": TELEGRAM_CHAT_ID,
         "text": message,
@@ -94,7 +222,7 @@ def send_telegram_notification(message: str) -> bool:
     }
     
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        response = telegram_session.post(TELEGRAM_URL, json=payload, timeout=10)
         if response.status_code == 200:
             log("✅ Telegram notification sent")
             return True
@@ -106,224 +234,377 @@ def send_telegram_notification(message: str) -> bool:
         return False
 
 
-def create_session() -> bool:
-    """Create a new session by visiting the main page to get cookies."""
-    global session, last_session_time
+def find_html_cut(text: str, limit: int) -> int:
+    """Index at or before limit to cut text at, never inside a tag or entity.
     
-    log("🔄 Creating new session...")
+    Prefers the last whitespace; falls back to the last safe character.
+    """
+    in_tag = False
+    in_entity = False
+    last_space = 0
+    last_safe = 0
+    for i, char in enumerate(text[:limit]):
+        if not in_tag and not in_entity:
+            last_safe = i
+            if char.isspace():
+                last_space = i + 1
+        if char == "<":
+            in_tag = True
+        elif char == ">":
+            in_tag = False
+        elif char == "&":
+            in_entity = True
+        elif char == ";" or char.isspace():
+            in_entity = False
     
-    try:
-        session = requests.Session()
-        session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36",
-            "Accept-Language": "en-US,en;q=0.9,ru;q=0.8,uk;q=0.7",
-        })
-        
-        # Visit home page to get session cookies
-        resp = session.get(HOME_URL, allow_redirects=True, timeout=30)
-        
-        if resp.status_code == 200:
-            # Set cookies from cURL command
-            session.cookies.set("JSESSIONID", "node0fyuli80i184di6c00qfl0vgh14653051.node0")
-            session.cookies.set("DTicketPublicSessionId", "w-G3202zJgsLmSuiYEACZJsbsewqelciK_DJOKs58mI")
-            session.cookies.set("DTicketPublicUserName", "DTicketPublicWeb")
-            session.cookies.set("accessType", "4")
-            session.cookies.set("lang", "en")
-            session.cookies.set("TS0190b5aa", "01071ea79e6a61529dbc3c21057473d323f8dd4409efb31ba68dcd8feea09d72fb74d5a5551def40966be43f3c7e3b374e1492b8d36eeb055b9ea43493aa13d1de92600506233963dc61a7acd15c8dc9739b6fecb17c8bbcf896a9d1bb3d8c666ea37b8df999cdcee07cfbb748800bb0bfd4cd3f60188d1d8c7d13fbf77858387a0aecd26d107f6443c109080236d82cd56de3e99ff04492b56aa586739d180133ba4317e3")
-            session.cookies.set("dticket", "352456876.37151.0000")
-            session.cookies.set("TS0185f5ba", "01071ea79e340aacb8a982aa6beff835b0350f1ec3efb31ba68dcd8feea09d72fb74d5a5551def40966be43f3c7e3b374e1492b8d357767d7f258a5f039c4ba4ae9f598c54")
-            session.cookies.set("ccmp_uuid", "cf7dde85-eb57-494f-9835-5155ddb1c679")
-            session.cookies.set("ccmp_strictly_setting", "true")
-            session.cookies.set("ccmp_functional_setting", "true")
-            session.cookies.set("ccmp_analytics_setting", "true")
-            session.cookies.set("ccmp_advertising_setting", "true")
-            session.cookies.set("TS7d2cd1d6027", "0883a5da20ab2000fdccdf4685ed2b514f814a79b539d6d159a675a04de543f94fed11a4c898bdae08165c74e9113000594a9b82240cc97fa294d777c28bacdf35d77ca2d87d8fac2b327edfadfa59bbce3c634aa1ceb69822e9660cac1f0122")
-            
-            last_session_time = datetime.now()
-            log(f"✅ Session created (cookies: {len(session.cookies)})")
-            return True
-        else:
-            log(f"❌ Failed to create session: HTTP {resp.status_code}")
-            return False
-            
-    except Exception as e:
-        log(f"❌ Session error: {e}")
-        return False
+    if not in_tag and not in_entity:
+        last_safe = min(len(text), limit)
+    # Always make progress, even on a single oversized tag
+    return last_space or last_safe or limit
+
 
+def split_long_line(line: str) -> list:
+    """Split one line over the size limit into valid HTML pieces."""
+    pieces = []
+    while len(line) > TELEGRAM_MESSAGE_LIMIT:
+        # Leave room to close a <b> left open by the cut
+        cut = find_html_cut(line, TELEGRAM_MESSAGE_LIMIT - len("</b>"))
+        head, line = line[:cut], line[cut:]
+        if head.count("<b>") > head.count("</b>"):
+            head += "</b>"
+            line = "<b>" + line
+        pieces.append(head)
+    pieces.append(line)
+    return pieces
 
-def ensure_session() -> bool:
-    """Ensure we have a valid session, refresh if needed."""
-    global session, last_session_time
+
+def split_message(message: str) -> list:
+    """Split a message into pieces within the Telegram size limit, at line breaks."""
+    pieces = []
+    piece = ""
+    for line in message.splitlines(keepends=True):
+        # A single line over the limit is cut at whitespace, keeping tags intact
+        if len(line) > TELEGRAM_MESSAGE_LIMIT:
+            *whole, piece = split_long_line(piece + line)
+            pieces.extend(whole)
+            continue
+        if len(piece) + len(line) > TELEGRAM_MESSAGE_LIMIT:
+            pieces.append(piece)
+            piece = ""
+        piece += line
     
-    # Refresh session every 20 minutes or if it doesn't exist
-    if session is None or last_session_time is None:
-        return create_session()
+    if piece:
+        pieces.append(piece)
+    return pieces
+
+
+def send_telegram_batch(messages: list):
+    """Send messages joined into as few Telegram messages as fit the size limit.
     
-    if datetime.now() - last_session_time > timedelta(minutes=20):
-        log("🔄 Session expired, refreshing...")
-        return create_session()
+    Messages too long on their own are split at line breaks first.
+    """
+    batch = ""
+    for message in messages:
+        if not message:
+            continue
+        first, *rest = split_message(message)
+        if not batch:
+            batch = first
+        elif len(batch) + len(NOTIFICATION_SEPARATOR) + len(first) <= TELEGRAM_MESSAGE_LIMIT:
+            batch += NOTIFICATION_SEPARATOR + first
+        else:
+            send_telegram_notification(batch)
+            batch = first
+        
+        # Continuations of a split message go out on their own
+        for piece in rest:
+            send_telegram_notification(batch)
+            batch = piece
     
-    return True
+    if batch:
+        send_telegram_notification(batch)
 
 
-def get_train_coaches(trip: dict) -> Optional[dict]:
-    """Get coach/seat availability for a specific trip."""
-    global session
+def get_coaches(response_data: dict) -> list:
+    """Extract the coach list from an API response."""
+    if not response_data or not response_data.get("result", False):
+        return []
     
-    if not ensure_session():
-        return None
+    data = response_data.get("data", {})
+    if not data:
+        return []
     
-    try:
-        data = {
-            "tripId": trip["tripId"],
-            "provinceStartId": trip["provinceStartId"],
-            "provinceEndId": trip["provinceEndId"],
-            "viewStateHolder": trip["viewStateHolder"],
-        }
-        
-        resp = session.post(
-            GET_COACH_URL,
-            data=data,
-            headers=AJAX_HEADERS,
-            timeout=30
-        )
-        
-        if resp.status_code == 200:
-            return resp.json()
-        elif resp.status_code == 500:
-            log(f"   ⚠️ Server error, will refresh session")
-            session = None  # Force session refresh
-            return None
-        else:
-            log(f"   ❌ HTTP {resp.status_code}")
-            return None
-            
-    except json.JSONDecodeError:
-        log(f"   ❌ Invalid JSON response")
-        return None
-    except Exception as e:
-        log(f"   ❌ Error: {e}")
-        return None
+    return data.get("results", [])
+
+
+def get_seat_counts(response_data: dict) -> dict:
+    """Available seats per sleeping coach, without building the seat list."""
+    seat_counts = {}
+    for coach in get_coaches(response_data):
+        if coach and coach.get("coachSeatTypeEn") != SEATING_COACH:
+            seat_count = coach.get("availableSeatCount", 0)
+            if seat_count > 0:
+                # Coaches without a number (or sharing one) add up rather than overwrite
+                coach_no = coach.get("coachNo", "?")
+                seat_counts[coach_no] = seat_counts.get(coach_no, 0) + seat_count
+    return seat_counts
 
 
 def parse_availability(response_data: dict) -> list:
     """Parse the API response and extract seat availability info."""
     available_seats = []
     
-    if not response_data:
-        return available_seats
-    
-    if not response_data.get("result", False):
-        return available_seats
-    
-    data = response_data.get("data", {})
-    if not data:
-        return available_seats
+    for coach in get_coaches(response_data):
+        if not coach:
+            continue
         
-    coaches = data.get("results", [])
-    
-    for coach in coaches:
-        seat_count = coach.get("availableSeatCount", 0)
-        coach_no = coach.get("coachNo", "?")
-        coach_class = coach.get("coachClassDescEn", "Unknown")
+        # Skip Seating Coach - only track Sleeping Coach
         seat_type = coach.get("coachSeatTypeEn", "Unknown")
-        air_type = coach.get("coachAirTypeEn", "")
+        if seat_type == SEATING_COACH:
+            continue
         
-        # Skip Seating Coach - only track Sleeping Coach
-        if seat_type == "Seating Coach":
+        seat_count = coach.get("availableSeatCount", 0)
+        if seat_count <= 0:
             continue
         
+        coach_class = coach.get("coachClassDescEn", "Unknown")
+        air_type = coach.get("coachAirTypeEn", "")
+        
         coach_desc = f"{coach_class} - {seat_type}"
         if air_type:
             coach_desc += f" ({air_type})"
         
-        if seat_count > 0:
-            available_seats.append({
-                "coach_type": coach_desc,
-                "coach_no": coach_no,
-                "available_count": seat_count,
-            })
+        available_seats.append({
+            "coach_type": coach_desc,
+            "coach_no": coach.get("coachNo", "?"),
+            "available_count": seat_count,
+        })
     
     return available_seats
 
 
-def format_availability_message(trip_name: str, available_seats: list) -> str:
+def format_availability_message(search_name: str, trip_name: str, available_seats: list) -> str:
     """Format notification message."""
-    message = f"🚂 <b>TICKETS AVAILABLE!</b>\n\n"
-    message += f"<b>{SEARCH_NAME}</b>\n"
-    message += f"Train: <b>{trip_name}</b>\n\n"
-    
-    for seat in available_seats:
-        message += f"🎫 {seat['coach_type']} (Coach #{seat['coach_no']})\n"
-        message += f"   Available: <b>{seat['available_count']}</b> seats\n\n"
-    
-    return message
+    parts = [AVAILABILITY_HEADER_TEMPLATE.format(search=search_name, trip=trip_name)]
+    parts.extend(AVAILABILITY_ROW_TEMPLATE.format_map(seat) for seat in available_seats)
+    return "".join(parts)
 
 
-def check_all_trains():
-    """Check availability for all configured trips."""
-    global previous_availability
-    
-    log("=" * 50)
-    log("Checking availability...")
-    
-    if not ensure_session():
-        log("❌ No session, skipping check")
-        return
+@dataclass(slots=True)
+class Monitor:
+    """Railway session state shared by all monitored searches."""
+    configs: list
+    session: Optional[requests.Session] = None
+    session_expires_at: float = 0.0  # time.monotonic() deadline
+    adapter: HTTPAdapter = field(default_factory=create_railway_adapter)
+    # Cache validators from the last home page fetch, for conditional refreshes
+    home_etag: Optional[str] = None
+    home_last_modified: Optional[str] = None
     
-    error_count = 0
+    def count_trips(self) -> int:
+        """Total number of trips across all monitored searches."""
+        return sum(len(c.trips) for c in self.configs)
     
-    for trip in TRIPS_TO_MONITOR:
-        trip_name = trip["name"]
-        log(f"{trip_name}...")
+    def create_session(self) -> bool:
+        """Create a new session by visiting the main page to get cookies."""
+        log("🔄 Creating new session...")
         
-        response = get_train_coaches(trip)
+        try:
+            session = requests.Session()
+            session.headers.update({
+                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36",
+                "Accept-Language": "en-US,en;q=0.9,ru;q=0.8,uk;q=0.7",
+                "Connection": "keep-alive",
+            })
+            
+            # Reuse the pooled connections across refreshes: only the cookies
+            # need to be fresh, not the TCP/TLS connections.
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            
+            # Visit home page to get session cookies. Only the cookies matter, so
+            # send the cached validators and let the server answer 304 with no body.
+            headers = {}
+            if self.home_etag:
+                headers["If-None-Match"] = self.home_etag
+            if self.home_last_modified:
+                headers["If-Modified-Since"] = self.home_last_modified
+            
+            resp = session.get(HOME_URL, headers=headers, allow_redirects=True, timeout=30)
+            
+            # A 304 from a cache in front of the origin may carry no Set-Cookie,
+            # which would leave a session with no cookies at all.
+            if resp.status_code == 304 and SESSION_COOKIE not in session.cookies:
+                log("   304 without session cookie, fetching home page in full")
+                self.clear_home_validators()
+                resp = session.get(HOME_URL, allow_redirects=True, timeout=30)
+            
+            if resp.status_code in (200, 304):
+                self.home_etag = resp.headers.get("ETag", self.home_etag)
+                self.home_last_modified = resp.headers.get("Last-Modified", self.home_last_modified)
+                
+                # Session cookies come from the home page's Set-Cookie headers;
+                # only the language preference needs setting by hand.
+                session.cookies.set("lang", "en")
+                
+                self.session = session
+                self.session_expires_at = time.monotonic() + SESSION_LIFETIME_SECONDS
+                log(f"✅ Session created (cookies: {len(session.cookies)})")
+                return True
+            else:
+                log(f"❌ Failed to create session: HTTP {resp.status_code}")
+                return False
         
-        if response is None:
-            error_count += 1
-            if error_count >= 3:
-                log("🔄 Too many errors, refreshing session...")
-                create_session()
-                error_count = 0
-            time.sleep(1)
-            continue
+        except Exception as e:
+            log(f"❌ Session error: {e}")
+            return False
+
+    def clear_home_validators(self):
+        """Make the next home page fetch unconditional."""
+        self.home_etag = None
+        self.home_last_modified = None
+
+    def force_refresh(self):
+        """Drop the current session so the next check creates a fresh one."""
+        self.session = None
+        self.clear_home_validators()
+
+    def ensure_session(self) -> bool:
+        """Ensure we have a valid session, refresh if needed."""
+        # Refresh session every 20 minutes or if it doesn't exist
+        if self.session is None:
+            return self.create_session()
+        
+        if time.monotonic() >= self.session_expires_at:
+            log("🔄 Session expired, refreshing...")
+            return self.create_session()
         
-        available_seats = parse_availability(response)
-        total_available = sum(s["available_count"] for s in available_seats)
+        return True
+
+    def get_train_coaches(self, config: Config, trip: dict) -> Optional[dict]:
+        """Get coach/seat availability for a specific trip.
         
-        prev_available = previous_availability.get(trip_name, 0)
+        Returns UNCHANGED if the response is byte-identical to the last one seen.
+        """
+        # Trips are fetched concurrently, so work on a local reference in case
+        # another worker drops the shared session mid-request.
+        http = self.session
+        if http is None:
+            # Another worker hit a 500 and dropped the session this cycle
+            log(f"   ⚠️ {trip['name']}: session dropped, skipped")
+            return None
         
-        if total_available > 0:
-            log(f"   🎉 {total_available} seats available!")
+        try:
+            resp = http.post(
+                GET_COACH_URL,
+                data=trip["_post_data"],
+                headers=AJAX_HEADERS,
+                timeout=COACH_REQUEST_TIMEOUT
+            )
             
-            if prev_available == 0:
-                message = format_availability_message(trip_name, available_seats)
-                send_telegram_notification(message)
+            if resp.status_code == 200:
+                digest = hashlib.blake2b(resp.content, digest_size=16).digest()
+                if config.previous_hash.get(trip["name"]) == digest:
+                    return UNCHANGED
+                response_data = orjson.loads(resp.content)
+                config.previous_hash[trip["name"]] = digest
+                return response_data
+            elif resp.status_code == 500:
+                log(f"   ⚠️ {trip['name']}: server error, will refresh session")
+                self.force_refresh()
+                return None
             else:
-                log(f"   (already notified)")
-        else:
-            log(f"   ❌ No seats")
-            if prev_available > 0:
-                log(f"   ⚠️ Seats gone (were: {prev_available})")
+                log(f"   ❌ {trip['name']}: HTTP {resp.status_code}")
+                return None
         
-        previous_availability[trip_name] = total_available
-        time.sleep(1)
-    
-    log("Done.")
-    log("=" * 50)
-
-
-def send_startup_message():
-    """Send startup notification."""
-    trip_list = "\n".join([f"  • {t['name']}" for t in TRIPS_TO_MONITOR])
-    message = (
-        f"🤖 <b>Train Monitor Started</b>\n\n"
-        f"<b>{SEARCH_NAME}</b>\n\n"
-        f"Monitoring {len(TRIPS_TO_MONITOR)} trips:\n{trip_list}\n\n"
-        f"Check interval: {CHECK_INTERVAL_MINUTES} min\n"
-        f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    )
-    send_telegram_notification(message)
+        except orjson.JSONDecodeError:
+            log(f"   ❌ {trip['name']}: invalid JSON response")
+            return None
+        except Exception as e:
+            log(f"   ❌ {trip['name']}: error: {e}")
+            return None
+
+    def check_all_trains(self):
+        """Check availability for all configured trips."""
+        log("=" * 50)
+        log("Checking availability...")
+        
+        if not self.ensure_session():
+            log("❌ No session, skipping check")
+            return
+        
+        # Fire all trip requests at once - the work is purely I/O-bound, so the
+        # cycle takes one round-trip instead of one per trip.
+        jobs = [(config, trip) for config in self.configs for trip in config.trips]
+        responses = list(fetch_pool.map(lambda job: self.get_train_coaches(*job), jobs))
+        
+        error_count = 0
+        pending_messages = []
+        
+        for (config, trip), response in zip(jobs, responses):
+            trip_name = trip["name"]
+            log(f"{config.search_name} / {trip_name}...")
+            
+            if response is None:
+                error_count += 1
+                continue
+            
+            prev_available = config.previous_availability.get(trip_name, 0)
+            
+            if response is UNCHANGED:
+                log(f"   (unchanged, {prev_available} seats)")
+                continue
+            
+            seat_counts = get_seat_counts(response)
+            total_available = sum(seat_counts.values())
+            prev_seats = config.previous_seats.get(trip_name, {})
+            
+            if total_available > 0:
+                log(f"   🎉 {total_available} seats available!")
+                
+                # Notify whenever seats open up in any coach, not only when the
+                # trip goes from none to some. Seats being taken stays quiet.
+                # The per-coach breakdown is only built when it's going to be sent.
+                if any(count > prev_seats.get(coach_no, 0) for coach_no, count in seat_counts.items()):
+                    available_seats = parse_availability(response)
+                    pending_messages.append(
+                        format_availability_message(config.search_name, trip_name, available_seats)
+                    )
+                else:
+                    log(f"   (already notified)")
+            else:
+                log(f"   ❌ No seats")
+                if prev_available > 0:
+                    log(f"   ⚠️ Seats gone (were: {prev_available})")
+            
+            config.previous_availability[trip_name] = total_available
+            config.previous_seats[trip_name] = seat_counts
+        
+        # One Telegram round-trip for everything that opened up this cycle
+        if pending_messages:
+            send_telegram_batch(pending_messages)
+        
+        if error_count >= 3:
+            log("🔄 Too many errors, refreshing session...")
+            self.force_refresh()
+            self.create_session()
+        
+        log("Done.")
+        log("=" * 50)
+
+    def send_startup_message(self):
+        """Send startup notification."""
+        searches = "\n\n".join([
+            f"<b>{c.search_name}</b>\n" + "\n".join([f"  • {t['name']}" for t in c.trips])
+            for c in self.configs
+        ])
+        message = STARTUP_TEMPLATE.format(
+            trip_count=self.count_trips(),
+            searches=searches,
+            interval=CHECK_INTERVAL_MINUTES,
+            started=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        )
+        send_telegram_notification(message)
 
 
 def main():
@@ -347,27 +628,32 @@ def main():
     ╚════════════════════════════════════════════════╝
     """, flush=True)
     
-    log(f"Monitoring {len(TRIPS_TO_MONITOR)} trips")
+    monitor = Monitor(load_configs())
+    
+    log(f"Monitoring {monitor.count_trips()} trips across {len(monitor.configs)} searches")
     log(f"Check interval: {CHECK_INTERVAL_MINUTES} minutes")
     
     # Initialize session
-    create_session()
+    monitor.create_session()
     
     # Send startup notification
-    send_startup_message()
-    
-    # First check
-    check_all_trains()
-    
-    # Schedule periodic checks
-    schedule.every(CHECK_INTERVAL_MINUTES).minutes.do(check_all_trains)
+    monitor.send_startup_message()
     
-    log(f"Next check in {CHECK_INTERVAL_MINUTES} minutes...")
+    # Periodic checks on a monotonic schedule: sleep straight through to the
+    # next run instead of polling, and don't drift by the time a check takes.
+    next_run = time.monotonic()
     
     try:
         while True:
-            schedule.run_pending()
-            time.sleep(1)
+            monitor.check_all_trains()
+            next_run += CHECK_INTERVAL_MINUTES * 60
+            # If a check overran the interval, skip the missed runs rather
+            # than firing them back to back.
+            next_run = max(next_run, time.monotonic())
+            log(f"Next check in {CHECK_INTERVAL_MINUTES} minutes...")
+            delay = next_run - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
     except KeyboardInterrupt:
         log("Stopped by user.")
         send_telegram_notification("🛑 <b>Train Monitor Stopped</b>")